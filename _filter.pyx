@@ -0,0 +1,69 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled version of filter_jsonl.apply_plan().
+Build with: python setup.py build_ext --inplace
+filter_jsonl.py falls back to its pure-Python walker when this is not built.
+"""
+
+from cpython.dict cimport PyDict_GetItemWithError, PyDict_SetItem
+from cpython.list cimport PyList_New, PyList_GET_ITEM, PyList_GET_SIZE, PyList_SET_ITEM
+from cpython.object cimport PyObject
+from cpython.ref cimport Py_INCREF
+
+
+# Must match the PLAN_* tags in filter_jsonl.py; leaves (PLAN_LEAF) are None
+cdef enum:
+    PLAN_DICT = 0
+    PLAN_LIST = 1
+
+# Plan layout this walker implements; filter_jsonl.py only uses it when this
+# equals its own PLAN_FORMAT
+PLAN_FORMAT = 2
+
+
+cpdef object apply_plan(tuple plan, object obj):
+    """
+    Recursively filter an object with a plan built by compile_schema().
+    Leaf values are handled inline, so primitives never cost a call.
+    """
+    cdef dict result
+    cdef list items
+    cdef PyObject* value
+    cdef Py_ssize_t i, size
+    cdef tuple element_plan
+    cdef tuple child_plan
+
+    if plan is None:
+        # Primitive value or no schema defined
+        return obj
+
+    if <int>plan[0] == PLAN_DICT:
+        if not isinstance(obj, dict):
+            return obj
+        # Keep only the schema keys, with a single borrowed-reference probe per key
+        result = {}
+        for key, child_plan in <tuple>plan[1]:
+            value = PyDict_GetItemWithError(obj, key)
+            if value is NULL:
+                continue
+            if child_plan is None:
+                PyDict_SetItem(result, key, <object>value)
+            else:
+                PyDict_SetItem(result, key, apply_plan(child_plan, <object>value))
+        return result
+
+    # PLAN_LIST
+    if not isinstance(obj, list):
+        return obj
+    element_plan = <tuple>plan[1]
+    if element_plan is None:
+        # Freshly parsed and not shared, so the list can be passed through
+        return obj
+    size = PyList_GET_SIZE(obj)
+    items = PyList_New(size)
+    for i in range(size):
+        item = apply_plan(element_plan, <object>PyList_GET_ITEM(obj, i))
+        # PyList_SET_ITEM steals a reference
+        Py_INCREF(item)
+        PyList_SET_ITEM(items, i, item)
+    return items
@@ -13,7 +13,66 @@ import sys
 import re
 import sqlite3
 import os
+import mmap
+import itertools
+import collections
+import multiprocessing
+import signal
 import liblzfse
+import orjson
+
+
+# Raw-bytes markers for French entries, checked before paying for a JSON parse.
+# Both the compact and the default json.dumps separator styles are covered;
+# the real lang_code check still runs after parsing, so a stray match in a
+# value only costs a parse.
+FR_LANG_MARKER = b'"lang_code":"fr"'
+FR_LANG_MARKER_SPACED = b'"lang_code": "fr"'
+
+# Node tags for compiled schema plans (see compile_schema). Leaves are plain
+# None rather than a tuple, so both this walker and _filter.pyx check them
+# with a cheap identity test, without a call or a tuple lookup.
+PLAN_DICT = 0
+PLAN_LIST = 1
+PLAN_LEAF = None
+
+# Version of the plan layout above; bump on any change and keep in sync with
+# PLAN_FORMAT in _filter.pyx
+PLAN_FORMAT = 2
+
+_MISSING = object()
+
+# Schema type annotations, matched in a single pass:
+# "string (optional)" or "string", bare number, and trailing commas
+SCHEMA_ANNOTATION_RE = re.compile(
+    r'(?P<string>"string\s*\([^)]*\)"|"string")'
+    r'|(?P<number>\bnumber\b)'
+    r'|,(?P<closing>\s*[}\]])'
+)
+
+# Compressed databases are written as a single LZFSE stream built from
+# independently compressed chunks (see compress_sqlite_db)
+COMPRESS_CHUNK_SIZE = 4 * 1024 * 1024
+LZFSE_END_OF_STREAM = b'bvx$'
+
+# Write buffer for JSONL output
+OUTPUT_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Raw lines handed to a worker process per task (see iter_filtered_rows)
+WORKER_CHUNK_LINES = 1000
+
+# Schema plan compiled once in each worker process by _init_worker()
+_worker_plan = None
+
+
+def _replace_schema_annotation(match):
+    """Substitution for SCHEMA_ANNOTATION_RE, keyed on which alternative matched."""
+    if match.group('string') is not None:
+        return '""'
+    if match.group('number') is not None:
+        return '0'
+    # Trailing comma: keep only what follows it
+    return match.group('closing')
 
 
 def parse_schema_structure(schema_file):
@@ -24,12 +83,8 @@ def parse_schema_structure(schema_file):
     with open(schema_file, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    # Replace type annotations with valid JSON values for parsing
-    # Handle patterns like "string (optional)" or "string"
-    content = re.sub(r'"string\s*\([^)]*\)"', '""', content)
-    content = re.sub(r'"string"', '""', content)
-    content = re.sub(r'\bnumber\b', '0', content)
-    content = re.sub(r',(\s*[}\]])', r'\1', content)  # Remove trailing commas
+    # Replace type annotations with valid JSON values for parsing, in one pass
+    content = SCHEMA_ANNOTATION_RE.sub(_replace_schema_annotation, content)
 
     try:
         schema = json.loads(content)
@@ -40,33 +95,189 @@ def parse_schema_structure(schema_file):
         return None
 
 
-def filter_by_schema(obj, schema):
+def iter_jsonl_lines(input_file):
+    """
+    Yield each line of a JSONL file as bytes (without the trailing newline).
+    The file is memory-mapped so the kernel pages it in on demand instead of
+    copying it through a buffered text reader.
+    """
+    with open(input_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Hint a front-to-back scan so the kernel reads ahead (Unix only)
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+
+            find = mm.find
+            start = 0
+            while True:
+                end = find(b'\n', start)
+                if end < 0:
+                    break
+                yield mm[start:end]
+                start = end + 1
+
+            # Last line without a trailing newline
+            if start < size:
+                yield mm[start:size]
+
+
+def chunked_iter(source, n):
+    """
+    Split an iterable into successive chunks of at most n items.
+    Each chunk is a lazy iterator over source rather than a list, so it must
+    be fully consumed before the next chunk is requested.
+    """
+    source = iter(source)
+    for first in source:
+        yield itertools.chain((first,), itertools.islice(source, n - 1))
+
+
+def compile_schema(schema):
+    """
+    Compile a parsed schema into a filtering plan, once per run.
+    A plan is a tagged tuple, (PLAN_DICT, ((key, child_plan), ...)) or
+    (PLAN_LIST, element_plan), or PLAN_LEAF for primitives and anything
+    without a schema.
     """
-    Recursively filter an object based on the schema structure.
+    if isinstance(schema, dict):
+        return (PLAN_DICT, tuple((key, compile_schema(child)) for key, child in schema.items()))
+
+    if isinstance(schema, list) and len(schema) > 0:
+        # Apply the schema of the first element to all elements
+        return (PLAN_LIST, compile_schema(schema[0]))
+
+    return PLAN_LEAF
+
+
+def apply_plan(plan, obj):
     """
-    if schema is None:
+    Recursively filter an object with a plan built by compile_schema().
+    Leaf values are handled inline, so primitives never cost a call.
+    """
+    if plan is PLAN_LEAF:
+        # Primitive value or no schema defined
         return obj
 
-    if isinstance(schema, dict) and isinstance(obj, dict):
-        # Filter dictionary keys based on schema
+    if plan[0] == PLAN_DICT:
+        if not isinstance(obj, dict):
+            return obj
+        # Keep only the schema keys, with a single dict probe per key
         result = {}
-        for key in schema.keys():
-            if key in obj:
-                result[key] = filter_by_schema(obj[key], schema[key])
+        get = obj.get
+        for key, child in plan[1]:
+            value = get(key, _MISSING)
+            if value is not _MISSING:
+                result[key] = value if child is PLAN_LEAF else apply_plan(child, value)
         return result
 
-    elif isinstance(schema, list) and len(schema) > 0:
-        # Schema defines an array structure
-        if isinstance(obj, list):
-            # Apply the schema of the first element to all elements
-            element_schema = schema[0]
-            return [filter_by_schema(item, element_schema) for item in obj]
-        else:
-            return obj
-
-    else:
-        # Primitive value or no schema defined
+    # PLAN_LIST
+    if not isinstance(obj, list):
         return obj
+    element_plan = plan[1]
+    if element_plan is PLAN_LEAF:
+        # Freshly parsed and not shared, so the list can be passed through
+        return obj
+    return [apply_plan(element_plan, item) for item in obj]
+
+
+# Prefer the compiled walker from _filter.pyx when it has been built
+# (python setup.py build_ext --inplace); the version above is the fallback.
+# A build from an older _filter.pyx still imports but expects a different
+# plan layout, so it is only used when its PLAN_FORMAT matches.
+try:
+    import _filter
+except ImportError:
+    _filter = None
+
+if _filter is not None:
+    if getattr(_filter, 'PLAN_FORMAT', None) == PLAN_FORMAT:
+        apply_plan = _filter.apply_plan
+    elif __name__ == "__main__":
+        print("Warning: _filter extension is out of date (rebuild with: python setup.py build_ext --inplace), "
+              "using pure-Python filtering", file=sys.stderr)
+
+
+def filter_lines(lines, plan):
+    """
+    Parse and filter raw JSONL lines, keeping only French entries.
+    Returns an (index, row) pair per entry, in input order, where index is
+    the line's position in lines and row is (word, pos, serialized).
+    """
+    rows = []
+    for index, line in enumerate(lines):
+        # Parse JSON line
+        obj = orjson.loads(line)
+
+        # Filter by lang_code == "fr"
+        if obj.get('lang_code') != 'fr':
+            continue
+
+        # Filter to schema fields (recursively)
+        filtered_obj = apply_plan(plan, obj)
+
+        # Serialize once for either output
+        rows.append((index, (filtered_obj.get('word', ''), filtered_obj.get('pos', ''), orjson.dumps(filtered_obj))))
+    return rows
+
+
+def _init_worker(schema):
+    """Pool initializer: compile the schema plan once per worker process."""
+    global _worker_plan
+    # Ctrl-C reaches the whole process group; leave it to the main process so
+    # in-flight tasks still complete and the pool can be closed and joined
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_plan = compile_schema(schema)
+
+
+def _filter_lines_in_worker(lines):
+    """Pool task: filter_lines() with the worker's compiled plan."""
+    return filter_lines(lines, _worker_plan)
+
+
+def iter_filtered_rows(numbered_lines, schema, workers, chunk_lines=WORKER_CHUNK_LINES):
+    """
+    Yield (line_number, row) pairs for (line_number, raw JSONL line) input,
+    in input order; row is (word, pos, serialized).
+    Parsing and filtering run in a pool of worker processes, chunk_lines
+    lines per task. At most 2 * workers tasks are in flight, so reading never
+    runs far ahead of the workers (Pool.imap would queue the whole input).
+    With a single worker everything runs in-process instead.
+    """
+    if workers <= 1:
+        plan = compile_schema(schema)
+        for chunk in chunked_iter(numbered_lines, chunk_lines):
+            line_numbers, lines = zip(*chunk)
+            for index, row in filter_lines(lines, plan):
+                yield line_numbers[index], row
+        return
+
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(schema,))
+    try:
+        # Line numbers stay in the reader; workers only see the raw lines
+        pending = collections.deque()
+        for chunk in chunked_iter(numbered_lines, chunk_lines):
+            line_numbers, lines = zip(*chunk)
+            pending.append((line_numbers, pool.apply_async(_filter_lines_in_worker, (lines,))))
+            if len(pending) < 2 * workers:
+                continue
+            line_numbers, result = pending.popleft()
+            for index, row in result.get():
+                yield line_numbers[index], row
+
+        while pending:
+            line_numbers, result = pending.popleft()
+            for index, row in result.get():
+                yield line_numbers[index], row
+    finally:
+        # Also reached when the consumer stops early (n reached). Let the few
+        # in-flight tasks finish instead of terminate(), which can deadlock
+        # while a large task is still being fed to the workers.
+        pool.close()
+        pool.join()
 
 
 def compress_sqlite_db(db_path):
@@ -74,19 +285,25 @@ def compress_sqlite_db(db_path):
     Compress SQLite database using LZFSE (Apple's compression algorithm for iOS).
     Creates db_path.lzfse and removes the original uncompressed database.
     LZFSE provides good compression with better performance than LZMA.
+
+    The database is streamed in COMPRESS_CHUNK_SIZE chunks instead of being
+    read into memory whole. An LZFSE stream is a sequence of self-contained
+    blocks closed by one end-of-stream marker, so each chunk's marker is
+    dropped and a single one is written at the end; the result decodes as one
+    stream with the standard decoder (Apple's Compression framework included).
     """
     compressed_path = f"{db_path}.lzfse"
 
     print(f"Compressing {db_path} -> {compressed_path}...", file=sys.stderr)
 
-    # Read the database file and compress it
-    with open(db_path, 'rb') as f_in:
-        data = f_in.read()
-        compressed_data = liblzfse.compress(data)
-
-    # Write compressed data
-    with open(compressed_path, 'wb') as f_out:
-        f_out.write(compressed_data)
+    with open(db_path, 'rb') as f_in, open(compressed_path, 'wb') as f_out:
+        while True:
+            chunk = f_in.read(COMPRESS_CHUNK_SIZE)
+            if not chunk:
+                break
+            compressed_chunk = liblzfse.compress(chunk)
+            f_out.write(compressed_chunk[:-len(LZFSE_END_OF_STREAM)])
+        f_out.write(LZFSE_END_OF_STREAM)
 
     # Get file sizes for reporting
     original_size = os.path.getsize(db_path)
@@ -105,39 +322,48 @@ def compress_sqlite_db(db_path):
 def init_sqlite_db(db_path):
     """
     Initialize SQLite database with schema for dictionary entries.
-    Uses FTS5 for full-text search on the word field.
+    Uses FTS5 for full-text search on the word field. The FTS5 tables start
+    empty and the index and triggers are added by finalize_sqlite_db().
     """
-    # Remove existing database if it exists
-    if os.path.exists(db_path):
-        os.remove(db_path)
+    # Remove existing database if it exists (one syscall, no exists/remove race)
+    try:
+        os.unlink(db_path)
+    except FileNotFoundError:
+        pass
 
-    conn = sqlite3.connect(db_path)
+    # Autocommit mode: SqliteOutput issues BEGIN/COMMIT itself, which skips
+    # the sqlite3 module's implicit transaction bookkeeping per statement
+    conn = sqlite3.connect(db_path, isolation_level=None)
     cursor = conn.cursor()
 
-    # Create main table for dictionary entries
+    # Bulk-load tuning. Dropping the journal and fsyncs is only safe because
+    # the database is rebuilt from scratch on every run: a crash mid-build
+    # leaves a corrupt file that the next run deletes anyway.
+    cursor.execute('PRAGMA page_size=16384')  # Must precede the first CREATE TABLE
+    cursor.execute('PRAGMA journal_mode=OFF')
+    cursor.execute('PRAGMA synchronous=OFF')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-262144')  # 256 MB page cache
+    cursor.execute('PRAGMA locking_mode=EXCLUSIVE')
+
+    # Create main table for dictionary entries. A plain INTEGER PRIMARY KEY
+    # uses the default rowid allocator and skips the sqlite_sequence update
+    # AUTOINCREMENT does per insert; ids of deleted rows could be reused, but
+    # this builder never deletes.
     cursor.execute('''
         CREATE TABLE entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER PRIMARY KEY,
             word TEXT NOT NULL,
             pos TEXT,
-            data TEXT NOT NULL
-        )
-    ''')
-
-    # Create FTS5 virtual table with default tokenizer for prefix queries
-    # Good for short prefix queries (1-2 characters)
-    cursor.execute('''
-        CREATE VIRTUAL TABLE entries_fts USING fts5(
-            word,
-            content=entries,
-            content_rowid=id
+            data BLOB NOT NULL
         )
     ''')
 
     # Create FTS5 virtual table with trigram tokenizer for substring matching
-    # Good for finding matches anywhere in the word
+    # Good for finding matches anywhere in the word (3+ characters); shorter
+    # prefix queries are served by the idx_word B-tree index instead
     cursor.execute('''
-        CREATE VIRTUAL TABLE entries_fts_trigram USING fts5(
+        CREATE VIRTUAL TABLE entries_fts USING fts5(
             word,
             content=entries,
             content_rowid=id,
@@ -145,18 +371,31 @@ def init_sqlite_db(db_path):
         )
     ''')
 
-    # Create triggers to keep both FTS5 tables in sync
+    return conn
+
+
+def finalize_sqlite_db(conn):
+    """
+    Build the FTS5 and word indexes once all entries have been inserted.
+    Bulk-building them here is much cheaper than maintaining them per row;
+    the triggers are only created afterwards, for any later edits.
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN')
+
+    # Populate the FTS5 table from the entries content table
+    cursor.execute("INSERT INTO entries_fts(entries_fts) VALUES('rebuild')")
+
+    # Create triggers to keep the FTS5 table in sync
     cursor.execute('''
         CREATE TRIGGER entries_ai AFTER INSERT ON entries BEGIN
             INSERT INTO entries_fts(rowid, word) VALUES (new.id, new.word);
-            INSERT INTO entries_fts_trigram(rowid, word) VALUES (new.id, new.word);
         END
     ''')
 
     cursor.execute('''
         CREATE TRIGGER entries_ad AFTER DELETE ON entries BEGIN
             INSERT INTO entries_fts(entries_fts, rowid, word) VALUES('delete', old.id, old.word);
-            INSERT INTO entries_fts_trigram(entries_fts_trigram, rowid, word) VALUES('delete', old.id, old.word);
         END
     ''')
 
@@ -164,69 +403,92 @@ def init_sqlite_db(db_path):
         CREATE TRIGGER entries_au AFTER UPDATE ON entries BEGIN
             INSERT INTO entries_fts(entries_fts, rowid, word) VALUES('delete', old.id, old.word);
             INSERT INTO entries_fts(rowid, word) VALUES (new.id, new.word);
-            INSERT INTO entries_fts_trigram(entries_fts_trigram, rowid, word) VALUES('delete', old.id, old.word);
-            INSERT INTO entries_fts_trigram(rowid, word) VALUES (new.id, new.word);
         END
     ''')
 
-    # Create index on word for non-FTS queries
+    # Create index on word for exact lookups and short prefix queries (GLOB 'li*')
     cursor.execute('CREATE INDEX idx_word ON entries(word)')
 
-    conn.commit()
-    return conn
+    cursor.execute('COMMIT')
 
 
 class SqliteOutput:
     """Handler for SQLite database output."""
 
     def __init__(self, db_path):
+        self.db_path = db_path
         self.conn = init_sqlite_db(db_path)
         self.cursor = self.conn.cursor()
-        self.batch = []
-        self.batch_size = 100
-
-    def write(self, filtered_obj):
-        """Write a filtered entry to the database."""
-        word = filtered_obj.get('word', '')
-        pos = filtered_obj.get('pos', '')
-        data = json.dumps(filtered_obj, ensure_ascii=False)
-
-        self.batch.append((word, pos, data))
-
-        if len(self.batch) >= self.batch_size:
-            self.flush()
-
-    def flush(self):
-        """Flush batch to database."""
-        if self.batch:
-            self.cursor.executemany(
-                'INSERT INTO entries (word, pos, data) VALUES (?, ?, ?)',
-                self.batch
-            )
-            self.conn.commit()
-            self.batch = []
+        self.batch_size = 5000
+        # Commit every commit_interval batches (100k rows) to cap transaction size
+        self.commit_interval = 20
+        self.batches_since_commit = 0
+
+        # Keep the whole load in explicit transactions instead of one per batch
+        self.cursor.execute('BEGIN')
+
+    def write_batch(self, rows):
+        """
+        Write (word, pos, serialized) rows to the database.
+        rows may be any iterable; executemany binds and steps it row by row,
+        so no intermediate list is built. The serialized UTF-8 JSON bytes are
+        stored as-is in the BLOB data column.
+        """
+        self.cursor.executemany(
+            'INSERT INTO entries (word, pos, data) VALUES (?, ?, ?)',
+            rows
+        )
+
+        self.batches_since_commit += 1
+        if self.batches_since_commit >= self.commit_interval:
+            self.cursor.execute('COMMIT')
+            self.cursor.execute('BEGIN')
+            self.batches_since_commit = 0
 
     def close(self):
-        """Close database connection."""
-        self.flush()
+        """Commit pending rows, build indexes, compact and close the database."""
+        self.cursor.execute('COMMIT')
+        finalize_sqlite_db(self.conn)
+        self.conn.execute('PRAGMA optimize')
+
+        # Write a tightly packed copy without the free pages and half-empty
+        # B-tree nodes left by the load and index builds, then swap it in.
+        # Smaller input also means less work for compress_sqlite_db().
+        compact_path = f"{self.db_path}.compact"
+        try:
+            os.unlink(compact_path)
+        except FileNotFoundError:
+            pass
+        self.conn.execute('VACUUM INTO ?', (compact_path,))
         self.conn.close()
+        os.replace(compact_path, self.db_path)
 
 
 class JsonlOutput:
     """Handler for JSONL output."""
 
     def __init__(self, output_file):
-        self.output = open(output_file, 'w', encoding='utf-8') if output_file else sys.stdout
-        self.should_close = output_file is not None
-
-    def write(self, filtered_obj):
-        """Write a filtered entry as JSONL."""
-        self.output.write(json.dumps(filtered_obj, ensure_ascii=False) + '\n')
+        # Binary output with a large buffer; stdout gets its own buffered
+        # writer on the same fd, left open on close
+        if output_file:
+            self.output = open(output_file, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+        else:
+            sys.stdout.flush()
+            self.output = open(sys.stdout.fileno(), 'wb', buffering=OUTPUT_BUFFER_SIZE, closefd=False)
+        self.batch_size = 1000
+
+    def write_batch(self, rows):
+        """
+        Write (word, pos, serialized) rows as JSONL: the rows joined with
+        newlines, then the final newline as a second buffered write, which
+        avoids copying the joined batch just to append it.
+        """
+        self.output.write(b'\n'.join([serialized for word, pos, serialized in rows]))
+        self.output.write(b'\n')
 
     def close(self):
-        """Close output file."""
-        if self.should_close:
-            self.output.close()
+        """Flush and close output file."""
+        self.output.close()
 
 
 def main():
@@ -290,27 +552,47 @@ def main():
         lines_read = 0
         lines_output = 0
 
-        with open(input_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                lines_read += 1
+        def candidate_lines():
+            """Yield (line_number, raw line) for lines that may hold a French entry."""
+            nonlocal lines_read
 
-                # Parse JSON line
-                obj = json.loads(line)
+            for line_number, line in enumerate(iter_jsonl_lines(input_file), 1):
+                lines_read = line_number
 
-                # Filter by lang_code == "fr"
-                if obj.get('lang_code') != 'fr':
+                # Cheap substring pre-screen in the reader, so non-French
+                # lines are never shipped to the workers
+                if FR_LANG_MARKER not in line and FR_LANG_MARKER_SPACED not in line:
                     continue
 
-                # Filter to schema fields (recursively)
-                filtered_obj = filter_by_schema(obj, schema)
+                yield line_number, line
+
+        def entry_rows():
+            """Yield a (word, pos, serialized) row per matching entry."""
+            nonlocal lines_read, lines_output
 
-                # Write filtered object
-                output_handler.write(filtered_obj)
+            # Parse and filter across all cores. A small n gets smaller tasks,
+            # and skips the pool entirely when it fits in a single task.
+            workers = os.cpu_count() or 1
+            chunk_lines = WORKER_CHUNK_LINES
+            if n is not None:
+                chunk_lines = max(1, min(WORKER_CHUNK_LINES, n))
+                if n < WORKER_CHUNK_LINES:
+                    workers = 1
+
+            for line_number, row in iter_filtered_rows(candidate_lines(), schema, workers, chunk_lines):
+                yield row
                 lines_output += 1
 
                 # Stop when we've output n lines (if n is specified)
                 if n is not None and lines_output >= n:
-                    break
+                    # The reader runs ahead of the filtering; report the
+                    # lines actually needed for the n entries
+                    lines_read = line_number
+                    return
+
+        # Stream rows to the output handler in lazy batches
+        for batch in chunked_iter(entry_rows(), output_handler.batch_size):
+            output_handler.write_batch(batch)
 
         print(f"\nRead {lines_read} lines, output {lines_output} entries", file=sys.stderr)
 
@@ -8,6 +8,11 @@
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 VENV_DIR="$SCRIPT_DIR/venv"
 REQUIREMENTS_FILE="$SCRIPT_DIR/requirements.txt"
+# Touched after each successful install, to detect requirements.txt changes
+REQUIREMENTS_MARKER="$VENV_DIR/.requirements-installed"
+# Touched when building _filter fails, so the build is only retried once
+# _filter.pyx or the installed dependencies change
+BUILD_FAILED_MARKER="$VENV_DIR/.filter-build-failed"
 
 # Check if virtual environment exists
 if [ ! -d "$VENV_DIR" ]; then
@@ -28,11 +33,13 @@ if [ ! -d "$VENV_DIR" ]; then
             echo "Error: Failed to install dependencies" >&2
             exit 1
         fi
+        touch "$REQUIREMENTS_MARKER"
+        rm -f "$BUILD_FAILED_MARKER"
     else
         # Fallback if requirements.txt doesn't exist
-        pip install pyliblzfse
+        pip install pyliblzfse orjson Cython setuptools
         if [ $? -ne 0 ]; then
-            echo "Error: Failed to install pyliblzfse" >&2
+            echo "Error: Failed to install dependencies" >&2
             exit 1
         fi
     fi
@@ -41,6 +48,32 @@ if [ ! -d "$VENV_DIR" ]; then
 else
     # Activate existing virtual environment
     source "$VENV_DIR/bin/activate"
+
+    # Update dependencies if requirements.txt changed since the last install
+    # (also true for venvs created before the marker existed)
+    if [ -f "$REQUIREMENTS_FILE" ] && [ "$REQUIREMENTS_FILE" -nt "$REQUIREMENTS_MARKER" ]; then
+        echo "requirements.txt changed, updating dependencies..." >&2
+        pip install -r "$REQUIREMENTS_FILE"
+        if [ $? -ne 0 ]; then
+            echo "Error: Failed to install dependencies" >&2
+            exit 1
+        fi
+        touch "$REQUIREMENTS_MARKER"
+        rm -f "$BUILD_FAILED_MARKER"
+    fi
+fi
+
+# Build the optional compiled schema walker when _filter.pyx is newer than the
+# built module (or none has been built yet) and than the last failed build
+if [ "$SCRIPT_DIR/_filter.pyx" -nt "$(ls "$SCRIPT_DIR"/_filter*.so 2>/dev/null | head -n 1)" ] \
+        && [ "$SCRIPT_DIR/_filter.pyx" -nt "$BUILD_FAILED_MARKER" ]; then
+    echo "Building _filter extension..." >&2
+    if (cd "$SCRIPT_DIR" && python3 setup.py build_ext --inplace >&2); then
+        rm -f "$BUILD_FAILED_MARKER"
+    else
+        echo "Warning: Failed to build _filter extension, using pure-Python filtering" >&2
+        touch "$BUILD_FAILED_MARKER"
+    fi
 fi
 
 # Run filter_jsonl.py with all provided arguments
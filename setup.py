@@ -0,0 +1,12 @@
+"""
+Build the optional compiled schema walker used by filter_jsonl.py.
+Usage: python setup.py build_ext --inplace
+"""
+
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name='dictdb-filter',
+    ext_modules=cythonize('_filter.pyx'),
+)